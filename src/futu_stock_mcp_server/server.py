@@ -2,6 +2,7 @@ import os
 import sys
 import warnings
 import logging
+import logging.handlers
 import argparse
 
 # CRITICAL: Check if this is a help command before setting MCP mode
@@ -22,6 +23,30 @@ warnings.simplefilter("ignore")
 # 2. Completely disable the standard logging system
 logging.disable(logging.CRITICAL)
 
+# Set up null handlers for problematic loggers
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        pass
+
+class _SilentLogger(logging.Logger):
+    """Logger that starts disabled, so libraries imported later stay quiet"""
+    def __init__(self, name, level=logging.NOTSET):
+        super().__init__(name, level)
+        self.disabled = True
+        self.propagate = False
+
+null_handler = NullHandler()
+logging.root.handlers = [null_handler]
+logging.root.setLevel(logging.CRITICAL + 1)
+
+# Every logger created from here on (mcp, futu, asyncio, ...) is silenced
+# at creation time; sweep the few that already exist once
+logging.setLoggerClass(_SilentLogger)
+for _existing_logger in logging.Logger.manager.loggerDict.values():
+    if isinstance(_existing_logger, logging.Logger):
+        _existing_logger.disabled = True
+        _existing_logger.propagate = False
+
 # 3. Set environment variables to prevent ANSI escape sequences
 os.environ['NO_COLOR'] = '1'
 os.environ['TERM'] = 'dumb'
@@ -31,44 +56,11 @@ os.environ['ANSI_COLORS_DISABLED'] = '1'
 os.environ['PYTHONUNBUFFERED'] = '1'
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
-# 4. Create a custom stdout wrapper to catch any accidental writes
-class StdoutProtector:
-    """Protects stdout from any non-MCP content"""
-    def __init__(self, original_stdout):
-        self.original = original_stdout
-        self.buffer = ""
-
-    def write(self, text):
-        # Only allow JSON-like content or empty strings
-        if not text or text.isspace():
-            self.original.write(text)
-        elif text.strip().startswith(('{', '[', '"')) or text.strip() == '':
-            self.original.write(text)
-        else:
-            # Silently drop non-JSON content
-            pass
-
-    def flush(self):
-        self.original.flush()
-
-    def readable(self):
-        """Delegate readable() method to original stdout"""
-        return getattr(self.original, 'readable', lambda: False)()
-
-    def writable(self):
-        """Delegate writable() method to original stdout"""
-        return getattr(self.original, 'writable', lambda: True)()
-
-    def seekable(self):
-        """Delegate seekable() method to original stdout"""
-        return getattr(self.original, 'seekable', lambda: False)()
-
-    def __getattr__(self, name):
-        return getattr(self.original, name)
+# MCP mode is fixed for the process lifetime; resolve it once
+_mcp_mode = os.environ.get('MCP_MODE') == '1'
 
-# Apply stdout protection in MCP mode VERY EARLY, before any imports
-# if os.getenv('MCP_MODE') == '1':
-    # sys.stdout = StdoutProtector(sys.stdout)
+# 4. stdout is reserved for MCP by protect_stdout() in main(), which moves
+# the real fd aside for the JSON-RPC transport and points fd 1 at /dev/null
 
 # 5. Don't redirect stderr in MCP mode - let it work normally
 # MCP servers can use stderr for logging, only stdout needs protection
@@ -76,30 +68,67 @@ _stderr_redirected = False
 _stderr_backup = None
 
 # Now we can safely import other modules
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 from collections.abc import AsyncIterator
-from typing import Dict, Any, List, Optional
+from typing import Annotated, Dict, Any, List, Optional
+from pydantic import Field
+import importlib.util
+import importlib.metadata
+
+def lazy_import(name: str):
+    """Import a module lazily; it is only executed on first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# futu (pandas, protobuf) and psutil are only loaded once a connection or
+# process check needs them, so --help/--version do not pay for them
 try:
-    from futu import OpenQuoteContext, OpenSecTradeContext, TrdMarket, SecurityFirm, RET_OK
-except ImportError as e:
+    futu = lazy_import('futu')
+except ImportError:
     # In MCP mode, we should avoid printing to stdout/stderr
-    # Log to file only
-    logger.error(f"Failed to import futu: {e}")
     sys.exit(1)
+psutil = lazy_import('psutil')
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
 import json
+import math
+import queue
+import base64
+import functools
+import re
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import traceback
 import asyncio
 from loguru import logger
 from dotenv import load_dotenv
+import anyio
 from mcp.server.fastmcp import FastMCP, Context
+from mcp.server.stdio import stdio_server
+import mcp.server.fastmcp.server as fastmcp_server
 from mcp.types import TextContent, PromptMessage
 from mcp.server import Server
 from mcp.server.session import ServerSession
 import atexit
+import weakref
 import signal
 import fcntl
-import psutil
 import time
-from datetime import datetime
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from datetime import datetime, date, timedelta
 
 # Get the user home directory and create logs directory there
 home_dir = os.path.expanduser("~")
@@ -113,42 +142,102 @@ os.makedirs(log_dir, exist_ok=True)
 # 3. Use MCP Context for operational logging when available
 # 4. Suppress third-party library logs that might pollute output
 
-# Completely silence warnings and third-party logs
-warnings.filterwarnings("ignore")
-
 # Configure loguru for file-only logging
 logger.remove()  # Remove all default handlers
 
-# CRITICAL: In MCP mode, ensure NO stderr output at all
-if os.getenv('MCP_MODE') == '1':
-    # Remove any remaining handlers that might output to stderr
-    logger.remove()
-    # Add only file handler - NO console output
-    logger.add(
-        os.path.join(log_dir, "futu_mcp_server.log"),
-        rotation="500 MB",
-        retention="10 days",
-        level="DEBUG",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}",
-        enqueue=True,  # Thread-safe logging
-        backtrace=True,
-        diagnose=True
-    )
-else:
-    # Non-MCP mode: add file handler
-    logger.add(
-        os.path.join(log_dir, "futu_mcp_server.log"),
-        rotation="500 MB",
-        retention="10 days",
-        level="DEBUG",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}",
-        enqueue=True,  # Thread-safe logging
-        backtrace=True,
-        diagnose=True
-    )
+# File writes happen on a QueueListener thread; callers only pay for a
+# SimpleQueue put instead of loguru's pickling multiprocessing queue
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that enqueues loguru's records as-is
+
+    Loguru hands over a freshly built record whose message is already
+    formatted (traceback included), so the default prepare() (format + copy)
+    is redundant work on the calling thread.
+    """
+    def prepare(self, record):
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+_log_queue = queue.SimpleQueue()
+_log_queue_handler = LogQueueHandler(_log_queue)
+_log_file_handler = logging.handlers.RotatingFileHandler(
+    os.path.join(log_dir, "futu_mcp_server.log"),
+    maxBytes=500 * 1024 * 1024,
+    backupCount=10,
+    encoding="utf-8"
+)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _log_file_handler, respect_handler_level=True
+)
+_log_listener.start()
+_log_listener_stopped = False
+
+def stop_log_listener():
+    """Stop the log listener after it has written every queued record; idempotent"""
+    global _log_listener_stopped
+    if not _log_listener_stopped:
+        _log_listener_stopped = True
+        _log_listener.stop()
+
+atexit.register(stop_log_listener)
+
+def hard_exit(code: int):
+    """os._exit() skips atexit, so drain the log queue first"""
+    stop_log_listener()
+    os._exit(code)
+
+# Common spellings loguru does not know as level names
+_LOG_LEVEL_ALIASES = {'WARN': 'WARNING', 'FATAL': 'CRITICAL'}
+
+def resolve_log_level(value: str) -> Optional[str]:
+    """Map a FUTU_LOG_LEVEL value to a loguru level name, or None if unknown"""
+    level = value.strip().upper()
+    level = _LOG_LEVEL_ALIASES.get(level, level)
+    try:
+        logger.level(level)
+    except ValueError:
+        return None
+    return level
+
+# Minimum level written to the log file; safe_log() skips anything below it.
+# An unknown value falls back to DEBUG (warned about once the sink exists)
+# rather than failing the import.
+_log_level_setting = os.getenv('FUTU_LOG_LEVEL', 'DEBUG')
+_log_level = resolve_log_level(_log_level_setting) or 'DEBUG'
+
+# Set FUTU_LOG_JSON=1 to write one JSON object per line instead of text
+_log_json = os.getenv('FUTU_LOG_JSON') == '1'
+
+def format_json_record(record) -> str:
+    """Loguru format function that serializes a record as a single JSON line"""
+    entry = {
+        'time': record['time'].strftime('%Y-%m-%d %H:%M:%S'),
+        'level': record['level'].name,
+        'name': record['name'],
+        'message': record['message']
+    }
+    if record['exception'] is not None:
+        entry['exception'] = ''.join(traceback.format_exception(*record['exception']))
+    if orjson is not None:
+        record['extra']['_json'] = orjson.dumps(entry, default=str).decode()
+    else:
+        record['extra']['_json'] = json.dumps(entry, default=str, ensure_ascii=False)
+    return "{extra[_json]}"
+
+# File handler only - NO console output (stderr is added below for debug mode)
+logger.add(
+    _log_queue_handler,
+    level=_log_level,
+    format=format_json_record if _log_json else "{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}",
+    backtrace=True,
+    diagnose=True
+)
+if resolve_log_level(_log_level_setting) is None:
+    logger.warning(f"Unknown FUTU_LOG_LEVEL {_log_level_setting!r}, falling back to DEBUG")
 
 # Only add stderr logging if explicitly in debug mode and not in MCP mode
-if os.getenv('FUTU_DEBUG_MODE') == '1' and not os.getenv('MCP_MODE') == '1':
+if os.getenv('FUTU_DEBUG_MODE') == '1' and not _mcp_mode:
     logger.add(
         sys.stderr,
         level="INFO",
@@ -157,99 +246,85 @@ if os.getenv('FUTU_DEBUG_MODE') == '1' and not os.getenv('MCP_MODE') == '1':
         filter=lambda record: record["level"].name in ["INFO", "WARNING", "ERROR", "CRITICAL"]
     )
 
-# Suppress all third-party library logging to prevent stdout pollution
-logging.disable(logging.CRITICAL)
-
-# Set up null handlers for problematic loggers
-class NullHandler(logging.Handler):
-    def emit(self, record):
-        pass
-
-null_handler = NullHandler()
-root_logger = logging.getLogger()
-root_logger.addHandler(null_handler)
-root_logger.setLevel(logging.CRITICAL + 1)
-
-# Specifically silence known problematic loggers
-for logger_name in [
-    'mcp', 'fastmcp', 'futu', 'uvicorn', 'asyncio',
-    'websockets', 'aiohttp', 'urllib3', 'requests'
-]:
-    lib_logger = logging.getLogger(logger_name)
-    lib_logger.disabled = True
-    lib_logger.addHandler(null_handler)
-    lib_logger.setLevel(logging.CRITICAL + 1)
-    lib_logger.propagate = False
-
-# Even more aggressive suppression for futu library
+# Third-party loggers (including futu's) are silenced by _SilentLogger above
 # This is critical because futu library may output logs during connection
+_futu_err_fd = None
 try:
-    # Suppress futu library logging completely
-    futu_logger = logging.getLogger('futu')
-    futu_logger.disabled = True
-    futu_logger.setLevel(logging.CRITICAL + 1)
-    futu_logger.propagate = False
-
-    # Suppress specific futu sub-modules that are known to output logs
-    for sub_logger_name in [
-        'futu', 'futu.common', 'futu.quote', 'futu.trade',
-        'futu.common.constant', 'futu.common.sys_utils',
-        'futu.quote.open_quote_context', 'futu.quote.quote_response_handler',
-        'futu.trade.open_trade_context', 'futu.trade.trade_response_handler',
-        'futu.common.open_context_base', 'futu.common.network_manager'
-    ]:
-        sub_logger = logging.getLogger(sub_logger_name)
-        sub_logger.disabled = True
-        sub_logger.setLevel(logging.CRITICAL + 1)
-        sub_logger.propagate = False
-
     # Also redirect any direct print statements from futu to a file
-    if os.getenv('MCP_MODE') == '1':
+    if _mcp_mode:
         # Create a special log file for futu connection logs
-        home_dir = os.path.expanduser("~")
-        log_dir = os.path.join(home_dir, "logs")
-        os.makedirs(log_dir, exist_ok=True)
-
         futu_conn_log_file = os.path.join(log_dir, "futu_connection.log")
-        futu_conn_log = open(futu_conn_log_file, 'a')
+        _futu_err_fd = os.open(futu_conn_log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
 
         # This is a last resort to catch any print statements from futu
-        # We'll redirect stderr to this file temporarily during connection
-        # and then restore it to devnull
+        # fd 2 is pointed at this file while connecting (see futu_stderr_to_log),
+        # which also catches C-level writes from the protobuf stack
 except Exception as e:
     # If we can't set up additional logging, continue anyway
     pass
 
+@contextmanager
+def futu_stderr_to_log():
+    """Temporarily point fd 2 at the futu connection log (MCP mode only)"""
+    if _futu_err_fd is None:
+        yield
+        return
+    sys.stderr.flush()
+    saved_fd = os.dup(2)
+    os.dup2(_futu_err_fd, 2)
+    try:
+        yield
+    finally:
+        sys.stderr.flush()
+        os.dup2(saved_fd, 2)
+        os.close(saved_fd)
+
+# Event loop the MCP server runs on, cached by lifespan() for safe_log()
+_event_loop = None
+
+# Log level -> name of the matching Context method
+_LEVEL_DISPATCH = {
+    'DEBUG': 'debug',
+    'INFO': 'info',
+    'WARNING': 'warning',
+    'ERROR': 'error'
+}
+
 # MCP-compatible logging helper functions
 async def log_to_mcp(ctx: Context, level: str, message: str):
     """Send log message through MCP Context when available"""
     try:
-        if level.upper() == "DEBUG":
-            await ctx.debug(message)
-        elif level.upper() == "INFO":
-            await ctx.info(message)
-        elif level.upper() == "WARNING":
-            await ctx.warning(message)
-        elif level.upper() == "ERROR":
-            await ctx.error(message)
+        attr = _LEVEL_DISPATCH.get(level.upper())
+        if attr is not None:
+            await getattr(ctx, attr)(message)
         else:
             await ctx.info(f"[{level}] {message}")
     except Exception:
         # Fallback to file logging if MCP context fails
         logger.log(level.upper(), message)
 
-def safe_log(level: str, message: str, ctx: Context = None):
-    """Safe logging that uses MCP context when available, file logging otherwise"""
+# Numeric threshold for _log_level, used for the cheap early-out in safe_log()
+_min_log_level_no = logger.level(_log_level).no
+
+def safe_log(level: str, message: str, *args, ctx: Context = None):
+    """Safe logging that uses MCP context when available, file logging otherwise
+
+    Any *args are %-formatted into message only if the level is enabled.
+    """
+    level = level.upper()
+    if logger.level(level).no < _min_log_level_no:
+        return
+    if args:
+        message = message % args
+
     # Always log to file
-    logger.log(level.upper(), message)
+    logger.log(level, message)
 
     # Also send to MCP if context is available
-    if ctx and os.getenv('MCP_MODE') == '1' and not _stderr_redirected:
+    loop = _event_loop
+    if ctx and loop is not None and _mcp_mode and not _stderr_redirected:
         try:
-            import asyncio
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                asyncio.create_task(log_to_mcp(ctx, level, message))
+            loop.call_soon_threadsafe(asyncio.ensure_future, log_to_mcp(ctx, level, message))
         except Exception:
             pass  # Ignore MCP logging errors
 
@@ -268,10 +343,51 @@ quote_ctx = None
 trade_ctx = None
 lock_fd = None
 _is_shutting_down = False
+_shutdown_requested = False
 _is_trade_initialized = False
+_trade_init_lock = threading.Lock()
 _futu_host = '127.0.0.1'
 _futu_port = 11111
 
+# Trading settings, read once from the environment
+_futu_enable_trading = os.getenv('FUTU_ENABLE_TRADING', '0') == '1'
+_futu_trade_env = os.getenv('FUTU_TRADE_ENV', 'SIMULATE')
+_futu_security_firm = os.getenv('FUTU_SECURITY_FIRM', 'FUTUSECURITIES')
+_futu_trd_market = os.getenv('FUTU_TRD_MARKET', 'HK')
+
+def read_pid_file():
+    """Read the PID stored in the PID file"""
+    fd = os.open(PID_FILE, os.O_RDONLY)
+    try:
+        return int(os.read(fd, 32).strip())
+    finally:
+        os.close(fd)
+
+def write_pid_file():
+    """Write the current PID to the PID file"""
+    fd = os.open(PID_FILE, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+    finally:
+        os.close(fd)
+
+def is_futu_process(pid):
+    """Check if the process with given PID is a futu_stock_mcp_server instance"""
+    # On Linux read /proc directly instead of building a psutil.Process
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return b'futu_stock_mcp_server' in f.read()
+    except FileNotFoundError:
+        if os.path.isdir('/proc/self'):
+            return False
+    except OSError:
+        pass
+
+    try:
+        return any('futu_stock_mcp_server' in cmd for cmd in psutil.Process(pid).cmdline())
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
 def is_process_running(pid):
     """Check if a process with given PID is running"""
     try:
@@ -286,26 +402,30 @@ def cleanup_stale_processes():
         return
         
     try:
-        # 只检查 PID 文件中的进程
-        if os.path.exists(PID_FILE):
+        # 只检查 PID 文件中的进程; a missing file is the common cold-start
+        # case and costs a single failed open, with no separate exists() stat
+        old_pid = None
+        has_pid_file = True
+        try:
+            old_pid = read_pid_file()
+        except FileNotFoundError:
+            has_pid_file = False
+        except (IOError, ValueError):
+            pass
+
+        if old_pid is not None and old_pid != os.getpid() and is_futu_process(old_pid):
+            logger.info(f"Found stale process {old_pid}")
             try:
-                with open(PID_FILE, 'r') as f:
-                    old_pid = int(f.read().strip())
-                    if old_pid != os.getpid():
-                        try:
-                            old_proc = psutil.Process(old_pid)
-                            if any('futu_stock_mcp_server' in cmd for cmd in old_proc.cmdline()):
-                                logger.info(f"Found stale process {old_pid}")
-                                old_proc.terminate()
-                                try:
-                                    old_proc.wait(timeout=3)
-                                except psutil.TimeoutExpired:
-                                    old_proc.kill()
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            pass
-            except (IOError, ValueError):
+                old_proc = psutil.Process(old_pid)
+                old_proc.terminate()
+                try:
+                    old_proc.wait(timeout=3)
+                except psutil.TimeoutExpired:
+                    old_proc.kill()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
                 pass
-            
+
+        if has_pid_file:
             # 清理 PID 文件
             try:
                 os.unlink(PID_FILE)
@@ -313,22 +433,32 @@ def cleanup_stale_processes():
                 pass
                 
         # 清理锁文件
-        if os.path.exists(LOCK_FILE):
-            try:
-                os.unlink(LOCK_FILE)
-            except OSError:
-                pass
+        try:
+            os.unlink(LOCK_FILE)
+        except OSError:
+            pass
                 
     except Exception as e:
         logger.error(f"Error cleaning up stale processes: {str(e)}")
 
+def wait_for_status(ctx, status, timeout: float) -> bool:
+    """Poll a Futu context until it reaches the given status or timeout expires"""
+    deadline = time.monotonic() + timeout
+    while ctx.status != status:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
 def cleanup_connections():
     """Clean up Futu connections"""
     global quote_ctx, trade_ctx
+    closed = []
     try:
         if quote_ctx:
             try:
                 quote_ctx.close()
+                closed.append(quote_ctx)
                 logger.info("Successfully closed quote context")
             except Exception as e:
                 logger.error(f"Error closing quote context: {str(e)}")
@@ -337,13 +467,15 @@ def cleanup_connections():
         if trade_ctx:
             try:
                 trade_ctx.close()
+                closed.append(trade_ctx)
                 logger.info("Successfully closed trade context")
             except Exception as e:
                 logger.error(f"Error closing trade context: {str(e)}")
             trade_ctx = None
             
         # 等待连接完全关闭
-        time.sleep(1)
+        for ctx in closed:
+            wait_for_status(ctx, futu.ContextStatus.CLOSED, 1)
     except Exception as e:
         logger.error(f"Error during connection cleanup: {str(e)}")
 
@@ -362,44 +494,39 @@ def release_lock():
     except Exception as e:
         logger.error(f"Error releasing lock: {str(e)}")
 
-def cleanup_all():
-    """Clean up all resources on exit"""
-    global _is_shutting_down
-    if _is_shutting_down:
-        return
-    _is_shutting_down = True
-    
+def _release_resources():
+    """Close the Futu connections and release the process lock"""
+    _futu_pool.shutdown(wait=False, cancel_futures=True)
     cleanup_connections()
     release_lock()
-    cleanup_stale_processes()
 
-def signal_handler(signum, frame):
-    """Handle process signals"""
+class _Resources:
+    """Sentinel owning the process-wide cleanup finalizer"""
+
+_resources = _Resources()
+# Runs at most once: on the first cleanup_all() call or at interpreter exit
+_resources_finalizer = weakref.finalize(_resources, _release_resources)
+
+def cleanup_all():
+    """Clean up all resources on exit; safe to call from any shutdown path"""
     global _is_shutting_down
-    if _is_shutting_down:
-        logger.info("Already shutting down, forcing exit...")
-        os._exit(1)
-        
-    # 只处理 SIGINT 和 SIGTERM
-    if signum not in (signal.SIGINT, signal.SIGTERM):
-        return
-        
-    logger.info(f"Received signal {signum}, cleaning up...")
     _is_shutting_down = True
+    _resources_finalizer()
 
-    try:
-        cleanup_all()
-        logger.info("Cleanup completed, exiting...")
-    except Exception as e:
-        logger.error(f"Error during cleanup: {e}")
-    finally:
-        # 强制退出，确保进程能够终止
-        os._exit(0)
+def request_shutdown(signum, main_task):
+    """Handle SIGINT/SIGTERM on the event loop by cancelling the server task
 
-# Register cleanup functions
-atexit.register(cleanup_all)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+    Runs as a loop callback, so an in-progress JSON-RPC write is never
+    interrupted; lifespan() performs the cleanup when the task unwinds.
+    """
+    global _shutdown_requested
+    if _shutdown_requested:
+        logger.info("Already shutting down, forcing exit...")
+        hard_exit(1)
+
+    logger.info(f"Received signal {signum}, cleaning up...")
+    _shutdown_requested = True
+    main_task.cancel()
 
 def acquire_lock():
     """Try to acquire the process lock"""
@@ -407,16 +534,10 @@ def acquire_lock():
         # 先检查 PID 文件
         if os.path.exists(PID_FILE):
             try:
-                with open(PID_FILE, 'r') as f:
-                    old_pid = int(f.read().strip())
-                    if old_pid != os.getpid() and psutil.pid_exists(old_pid):
-                        try:
-                            old_proc = psutil.Process(old_pid)
-                            if any('futu_stock_mcp_server' in cmd for cmd in old_proc.cmdline()):
-                                logger.error(f"Another instance is already running (PID: {old_pid})")
-                                return None
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            pass
+                old_pid = read_pid_file()
+                if old_pid != os.getpid() and is_futu_process(old_pid):
+                    logger.error(f"Another instance is already running (PID: {old_pid})")
+                    return None
             except (IOError, ValueError):
                 pass
         
@@ -429,8 +550,7 @@ def acquire_lock():
             return None
             
         # 写入 PID 文件
-        with open(PID_FILE, 'w') as f:
-            f.write(str(os.getpid()))
+        write_pid_file()
             
         return lock_fd
     except Exception as e:
@@ -447,26 +567,25 @@ def init_quote_connection():
     global quote_ctx, _futu_host, _futu_port
     
     try:
-        # Check if OpenD is running by attempting to get global state
+        # Initialize Futu connection and check OpenD is running on the same context
         try:
-            temp_ctx = OpenQuoteContext(
+            quote_ctx = futu.OpenQuoteContext(
                 host=_futu_host,
                 port=_futu_port
             )
-            ret, _ = temp_ctx.get_global_state()
-            temp_ctx.close()
-            if ret != RET_OK:
+            ret, _ = quote_ctx.get_global_state()
+            if ret != futu.RET_OK:
                 logger.error("OpenD is not running or not accessible")
+                quote_ctx.close()
+                quote_ctx = None
                 return False
         except Exception as e:
             logger.error(f"Failed to connect to OpenD: {str(e)}")
+            if quote_ctx is not None:
+                quote_ctx.close()
+                quote_ctx = None
             return False
 
-        # Initialize Futu connection
-        quote_ctx = OpenQuoteContext(
-            host=_futu_host,
-            port=_futu_port
-        )
         logger.info("Successfully connected to Futu Quote API")
         return True
         
@@ -475,61 +594,93 @@ def init_quote_connection():
         cleanup_connections()
         return False
 
+def trade_connection_alive() -> bool:
+    """Whether the cached trade context can be reused as-is"""
+    return bool(_is_trade_initialized and trade_ctx
+                and trade_ctx.status != futu.ContextStatus.CLOSED)
+
+def close_trade_connection():
+    """Close the trade context only, leaving the quote context untouched"""
+    global trade_ctx, _is_trade_initialized
+    _is_trade_initialized = False
+    if trade_ctx:
+        try:
+            trade_ctx.close()
+        except Exception as e:
+            logger.error(f"Error closing trade context: {str(e)}")
+        trade_ctx = None
+
 def init_trade_connection():
-    """Initialize trade connection only"""
-    global trade_ctx, _is_trade_initialized, _futu_host, _futu_port
-    
-    if _is_trade_initialized and trade_ctx:
+    """
+    Initialize the trade connection, reusing it across tool calls.
+
+    The context is only recreated once it has been closed or a previous
+    attempt failed; the lock keeps concurrent tool calls from racing to
+    create several contexts at once.
+    """
+    if trade_connection_alive():
         return True
+
+    with _trade_init_lock:
+        # Another caller may have finished initializing while we waited
+        if trade_connection_alive():
+            return True
+        close_trade_connection()
+        return connect_trade_context()
+
+def connect_trade_context():
+    """Create the trade context and verify account access"""
+    global trade_ctx, _is_trade_initialized
         
     try:
         # Initialize trade context with proper market access
-        trade_env = os.getenv('FUTU_TRADE_ENV', 'SIMULATE')
-        security_firm = getattr(SecurityFirm, os.getenv('FUTU_SECURITY_FIRM', 'FUTUSECURITIES'))
+        trade_env = _futu_trade_env
+        security_firm = getattr(futu.SecurityFirm, _futu_security_firm)
         
         # 只支持港股和美股
         market_map = {
             'HK': 1,  # TrdMarket.HK
             'US': 2   # TrdMarket.US
         }
-        trd_market = market_map.get(os.getenv('FUTU_TRD_MARKET', 'HK'), 1)
+        trd_market = market_map.get(_futu_trd_market, 1)
         
         # 创建交易上下文
-        trade_ctx = OpenSecTradeContext(
+        trade_ctx = futu.OpenSecTradeContext(
             filter_trdmarket=trd_market,
             host=_futu_host,
             port=_futu_port,
             security_firm=security_firm
         )
             
-        # 等待连接就绪
-        time.sleep(1)
-            
         # 验证连接状态
         if not trade_ctx:
             raise Exception("Failed to create trade context")
+
+        # 等待连接就绪
+        if not wait_for_status(trade_ctx, futu.ContextStatus.READY, 2):
+            logger.warning("Trade context not ready after 2s, continuing anyway")
             
         # Set trade environment
         if hasattr(trade_ctx, 'set_trade_env'):
             ret, data = trade_ctx.set_trade_env(trade_env)
-            if ret != RET_OK:
+            if ret != futu.RET_OK:
                 logger.warning(f"Failed to set trade environment: {data}")
                 
         # Verify account access and permissions
         ret, data = trade_ctx.get_acc_list()
-        if ret != RET_OK:
+        if ret != futu.RET_OK:
             logger.warning(f"Failed to get account list: {data}")
-            cleanup_connections()
+            close_trade_connection()
             return False
             
         if data is None or len(data) == 0:
             logger.warning("No trading accounts available")
-            cleanup_connections()
+            close_trade_connection()
             return False
             
         # Convert DataFrame to records if necessary
         if hasattr(data, 'to_dict'):
-            accounts = data.to_dict('records')
+            accounts = df_to_records(data)
         else:
             accounts = data
             
@@ -558,8 +709,7 @@ def init_trade_connection():
             
     except Exception as e:
         logger.error(f"Failed to initialize trade connection: {str(e)}")
-        cleanup_connections()
-        _is_trade_initialized = False
+        close_trade_connection()
         return False
 
 def init_futu_connection(host: str = '127.0.0.1', port: int = 11111) -> bool:
@@ -582,43 +732,45 @@ def init_futu_connection(host: str = '127.0.0.1', port: int = 11111) -> bool:
         # Log to file only
         logger.info(f"Initializing Futu connection to {host}:{port}")
 
-        # Initialize quote context
-        quote_ctx = OpenQuoteContext(host=host, port=port)
-
-        # Initialize trade context if needed
-        if os.getenv('FUTU_ENABLE_TRADING', '0') == '1':
-            # Get trading parameters
-            trade_env = os.getenv('FUTU_TRADE_ENV', 'SIMULATE')
-            security_firm = os.getenv('FUTU_SECURITY_FIRM', 'FUTUSECURITIES')
-            trd_market = os.getenv('FUTU_TRD_MARKET', 'HK')
-
-            # Map environment strings to Futu enums
-            trade_env_enum = {
-                'REAL': TrdMarket.REAL,
-                'SIMULATE': TrdMarket.SIMULATE
-            }.get(trade_env, TrdMarket.SIMULATE)
-
-            security_firm_enum = {
-                'FUTUSECURITIES': SecurityFirm.FUTUSECURITIES,
-                'FUTUINC': SecurityFirm.FUTUINC
-            }.get(security_firm, SecurityFirm.FUTUSECURITIES)
-
-            trd_market_enum = {
-                'HK': TrdMarket.HK,
-                'US': TrdMarket.US,
-                'CN': TrdMarket.CN,
-                'HKCC': TrdMarket.HKCC,
-                'AU': TrdMarket.AU
-            }.get(trd_market, TrdMarket.HK)
-
-            # Initialize trade context
-            trade_ctx = OpenSecTradeContext(
-                host=host,
-                port=port,
-                security_firm=security_firm_enum
-            )
-            _is_trade_initialized = True
-            logger.info("Trade context initialized successfully")
+        # Capture anything futu writes to stderr while connecting
+        with futu_stderr_to_log():
+            # Initialize quote context
+            quote_ctx = futu.OpenQuoteContext(host=host, port=port)
+
+            # Initialize trade context if needed
+            if _futu_enable_trading:
+                # Get trading parameters
+                trade_env = _futu_trade_env
+                security_firm = _futu_security_firm
+                trd_market = _futu_trd_market
+
+                # Map environment strings to Futu enums
+                trade_env_enum = {
+                    'REAL': futu.TrdMarket.REAL,
+                    'SIMULATE': futu.TrdMarket.SIMULATE
+                }.get(trade_env, futu.TrdMarket.SIMULATE)
+
+                security_firm_enum = {
+                    'FUTUSECURITIES': futu.SecurityFirm.FUTUSECURITIES,
+                    'FUTUINC': futu.SecurityFirm.FUTUINC
+                }.get(security_firm, futu.SecurityFirm.FUTUSECURITIES)
+
+                trd_market_enum = {
+                    'HK': futu.TrdMarket.HK,
+                    'US': futu.TrdMarket.US,
+                    'CN': futu.TrdMarket.CN,
+                    'HKCC': futu.TrdMarket.HKCC,
+                    'AU': futu.TrdMarket.AU
+                }.get(trd_market, futu.TrdMarket.HK)
+
+                # Initialize trade context
+                trade_ctx = futu.OpenSecTradeContext(
+                    host=host,
+                    port=port,
+                    security_firm=security_firm_enum
+                )
+                _is_trade_initialized = True
+                logger.info("Trade context initialized successfully")
 
         logger.info("Futu connection initialized successfully")
         return True
@@ -630,17 +782,332 @@ def init_futu_connection(host: str = '127.0.0.1', port: int = 11111) -> bool:
 
 @asynccontextmanager
 async def lifespan(server: Server):
+    global _event_loop
     # Startup - connections are already initialized in main()
     # No need to initialize here as it's done before mcp.run()
+    _event_loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    handled_signals = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            _event_loop.add_signal_handler(signum, request_shutdown, signum, main_task)
+            handled_signals.append(signum)
+        except (NotImplementedError, RuntimeError):
+            pass
     try:
         yield
     finally:
+        for signum in handled_signals:
+            _event_loop.remove_signal_handler(signum)
+        _event_loop = None
         # Shutdown - ensure connections are closed
         cleanup_all()
 
 # Create MCP server instance
 mcp = FastMCP("futu-stock-server", lifespan=lifespan)
 
+# Serialize dict tool results with orjson when it is installed. FastMCP's
+# default path runs pydantic's to_jsonable_python and then json.dumps.
+_orjson_results = False
+if orjson is not None and hasattr(fastmcp_server, '_convert_to_content'):
+    _default_convert_to_content = fastmcp_server._convert_to_content
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _json_safe(obj: Any):
+        """Match orjson's output for the json fallback: NaN/inf become null
+        and numpy arrays/scalars (from df_to_columnar) become Python values"""
+        if isinstance(obj, float):
+            return obj if math.isfinite(obj) else None
+        if isinstance(obj, dict):
+            return {k: _json_safe(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [_json_safe(v) for v in obj]
+        tolist = getattr(obj, 'tolist', None)
+        if tolist is not None:
+            return _json_safe(tolist())
+        return obj
+
+    def _orjson_convert_to_content(result: Any):
+        if isinstance(result, dict):
+            try:
+                text = orjson.dumps(result, default=str, option=_ORJSON_OPTIONS).decode()
+            except orjson.JSONEncodeError:
+                # e.g. integers beyond 64 bits. FastMCP's own fallback would
+                # str() the dict once it meets a numpy array, so use json here
+                text = json.dumps(
+                    _json_safe(result), default=str, ensure_ascii=False,
+                    allow_nan=False, separators=(',', ':')
+                )
+            return [TextContent(type="text", text=text)]
+        return _default_convert_to_content(result)
+
+    fastmcp_server._convert_to_content = _orjson_convert_to_content
+    _orjson_results = True
+
+# futu.SubType values are their own names; kept as literals so validating
+# sub_types does not force the lazy futu import
+SUB_TYPES = frozenset({
+    'QUOTE', 'ORDER_BOOK', 'TICKER', 'RT_DATA', 'BROKER',
+    'K_1M', 'K_3M', 'K_5M', 'K_15M', 'K_30M', 'K_60M',
+    'K_DAY', 'K_WEEK', 'K_MON', 'K_QUARTER', 'K_YEAR'
+})
+
+# futu.KLType and futu.Market values, likewise kept as literals
+KL_TYPES = frozenset({
+    'K_1M', 'K_3M', 'K_5M', 'K_15M', 'K_30M', 'K_60M',
+    'K_DAY', 'K_WEEK', 'K_MON', 'K_QUARTER', 'K_YEAR'
+})
+# Minute K-lines over long ranges span many pages; those requests are split
+# into date windows that are paged through concurrently
+INTRADAY_KL_TYPES = frozenset({'K_1M', 'K_3M', 'K_5M', 'K_15M', 'K_30M', 'K_60M'})
+HISTORY_KLINE_WINDOWS = 4
+MARKETS = frozenset({
+    'HK', 'US', 'SH', 'SZ', 'HK_FUTURE', 'SG', 'JP', 'AU', 'MY', 'CA', 'FX'
+})
+
+# Option tables shared by several tool docstrings. A line consisting of
+# just {NAME} in a docstring is replaced by the table at that indentation.
+_DOC_TABLES = {
+    'KTYPES': """\
+- "K_1M": 1 minute
+- "K_3M": 3 minutes
+- "K_5M": 5 minutes
+- "K_15M": 15 minutes
+- "K_30M": 30 minutes
+- "K_60M": 60 minutes
+- "K_DAY": Daily
+- "K_WEEK": Weekly
+- "K_MON": Monthly
+- "K_QUARTER": Quarterly
+- "K_YEAR": Yearly""",
+    'SUBTYPES': """\
+- "QUOTE": Basic quote (price, volume, etc.)
+- "ORDER_BOOK": Order book (bid/ask)
+- "TICKER": Ticker (trades)
+- "RT_DATA": Real-time data
+- "BROKER": Broker queue
+- "K_1M": 1-minute K-line
+- "K_3M": 3-minute K-line
+- "K_5M": 5-minute K-line
+- "K_15M": 15-minute K-line
+- "K_30M": 30-minute K-line
+- "K_60M": 60-minute K-line
+- "K_DAY": Daily K-line
+- "K_WEEK": Weekly K-line
+- "K_MON": Monthly K-line
+- "K_QUARTER": Quarterly K-line
+- "K_YEAR": Yearly K-line""",
+    'MARKETS': """\
+- "HK": Hong Kong market
+- "US": US market
+- "SH": Shanghai market
+- "SZ": Shenzhen market
+- "HK_FUTURE": Hong Kong futures market
+- "SG": Singapore market
+- "JP": Japan market
+- "AU": Australia market
+- "MY": Malaysia market
+- "CA": Canada market
+- "FX": Forex market""",
+}
+_DOC_TABLE_LINE = re.compile(r'^( *)\{(%s)\}$' % '|'.join(_DOC_TABLES), re.M)
+
+def doc_tables(fn):
+    """Expand shared option tables in fn's docstring
+
+    Must sit below @mcp.tool() (and any wrapping decorator), since FastMCP
+    reads the description when the tool is registered.
+    """
+    # Docstrings are stripped under python -OO
+    if fn.__doc__:
+        fn.__doc__ = _DOC_TABLE_LINE.sub(
+            lambda m: textwrap.indent(_DOC_TABLES[m.group(2)], m.group(1)), fn.__doc__
+        )
+    return fn
+
+# Symbol batch accepted by quote/snapshot tools; the bound is checked by
+# pydantic-core during argument validation, before any Futu call is made
+SymbolList = Annotated[List[str], Field(min_length=1, max_length=400)]
+
+def df_to_columnar(df) -> Dict[str, Any]:
+    """Convert a DataFrame into a column-oriented payload
+
+    Args:
+        df: DataFrame returned from Futu API
+
+    Returns:
+        Dict with 'columns' (column names in order) and 'data' (column name -> list of values)
+
+    Note:
+        When results are serialized by orjson, numeric and bool columns are
+        passed through as numpy arrays (OPT_SERIALIZE_NUMPY) instead of being
+        boxed into Python floats/ints one cell at a time.
+    """
+    columns = df.columns.tolist()
+    if len(df) == 0:
+        # Keep the column layout without touching the (empty) column data
+        return {'columns': columns, 'data': {col: [] for col in columns}}
+    if not _orjson_results:
+        return {
+            'columns': columns,
+            'data': {col: df[col].tolist() for col in columns}
+        }
+    data = {}
+    for col in columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind in 'biuf':
+            # orjson only serializes C-contiguous arrays
+            data[col] = np.ascontiguousarray(values)
+        else:
+            # Object/datetime columns go through pandas so they come out the
+            # same as the json path (numpy would yield raw nanosecond ints)
+            data[col] = df[col].tolist()
+    return {'columns': columns, 'data': data}
+
+# Large results can optionally be shipped as a base64 Arrow IPC stream for
+# clients that decode Arrow; everyone else gets the columnar dict
+ARROW_PAYLOAD_MIN_ROWS = 200
+_arrow_payload = (os.getenv('FUTU_ARROW_PAYLOAD', '0') == '1'
+                  and importlib.util.find_spec('pyarrow') is not None)
+if _arrow_payload:
+    pa = lazy_import('pyarrow')
+
+def df_to_payload(df) -> Dict[str, Any]:
+    """Convert a DataFrame into a response payload
+
+    Returns {'arrow_b64': ...} when FUTU_ARROW_PAYLOAD=1, pyarrow is
+    installed and the frame has more than ARROW_PAYLOAD_MIN_ROWS rows;
+    otherwise the df_to_columnar() dict.
+    """
+    if not _arrow_payload or len(df) <= ARROW_PAYLOAD_MIN_ROWS:
+        return df_to_columnar(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {'arrow_b64': base64.b64encode(sink.getvalue().to_pybytes()).decode('ascii')}
+
+def df_to_records(df) -> List[Dict[str, Any]]:
+    """Convert a DataFrame into a list of row dicts
+
+    Builds the rows from per-column tolist() values, which is much faster
+    than DataFrame.to_dict('records') boxing every cell individually. This
+    also holds for mixed-dtype frames (ticker, order book, broker queue),
+    where it beats itertuples(index=False, name=None) as well.
+
+    A single df.to_numpy().tolist() is not used: it is slower for both
+    mixed and all-numeric frames, and for the latter it upcasts int
+    columns to float (volume 100 -> 100.0).
+
+    Args:
+        df: DataFrame returned from Futu API
+
+    Returns:
+        List of dicts, one per row, keyed by column name
+    """
+    if len(df) == 0:
+        return []
+    columns = df.columns.tolist()
+    values = [df.iloc[:, i].tolist() for i in range(len(columns))]
+    # Local aliases avoid a builtins lookup per row in the comprehension
+    dict_ = dict
+    zip_ = zip
+    return [dict_(zip_(columns, row)) for row in zip_(*values)]
+
+class FdWriter:
+    """Minimal text file object that writes straight to a raw file descriptor"""
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def write(self, text: str) -> int:
+        view = memoryview(text.encode('utf-8'))
+        while view:
+            view = view[os.write(self.fd, view):]
+        return len(text)
+
+    def flush(self):
+        pass
+
+def protect_stdout() -> int:
+    """Reserve the real stdout for MCP JSON and send every other write to /dev/null
+
+    Returns:
+        A duplicate of the original stdout fd, to be used only by the MCP transport
+    """
+    sys.stdout.flush()
+    mcp_out_fd = os.dup(1)
+    devnull_fd = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull_fd, 1)
+    os.close(devnull_fd)
+    return mcp_out_fd
+
+async def run_stdio_server(mcp_out_fd: int):
+    """Run the MCP server over stdio, writing JSON-RPC messages to mcp_out_fd"""
+    stdout = anyio.wrap_file(FdWriter(mcp_out_fd))
+    async with stdio_server(stdout=stdout) as (read_stream, write_stream):
+        await mcp._mcp_server.run(
+            read_stream,
+            write_stream,
+            mcp._mcp_server.create_initialization_options()
+        )
+
+# Futu SDK calls are blocking network round-trips; run them on worker
+# threads so concurrent tool calls do not stall the event loop
+_futu_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='futu')
+
+async def futu_call(fn, *args, **kwargs):
+    """Run a blocking Futu SDK call on the worker pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_futu_pool, functools.partial(fn, *args, **kwargs))
+
+def ttl_cache(ttl: float = 300, maxsize: int = 512):
+    """
+    Cache an async tool's successful results for `ttl` seconds, keyed on its arguments.
+
+    Only used for reference data that changes at most daily; error
+    responses are never cached.
+    """
+    def decorator(fn):
+        cache = {}
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            hit = cache.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+            result = await fn(*args, **kwargs)
+            if 'error' not in result:
+                if len(cache) >= maxsize:
+                    # Dicts keep insertion order, so this drops the oldest entry
+                    cache.pop(next(iter(cache)))
+                cache.pop(key, None)
+                cache[key] = (now + ttl, result)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+def wrap_frame(key: str, data: Any, convert=df_to_records) -> Dict[str, Any]:
+    """Put a successful Futu result under `key`, converting it if it is a DataFrame
+
+    Args:
+        key: Response key, e.g. 'kline_list'
+        data: Data returned from Futu API
+        convert: DataFrame converter, df_to_records or df_to_columnar
+    """
+    return {key: convert(data) if isinstance(data, pd.DataFrame) else data}
+
+def error_response(data: Any) -> Dict[str, str]:
+    """Build the error payload for a failed Futu call
+
+    The SDK reports failures as a message string; anything else is
+    stringified so every tool returns the same {'error': str} shape.
+    """
+    return {'error': data if isinstance(data, str) else str(data)}
+
 def handle_return_data(ret: int, data: Any) -> Dict[str, Any]:
     """Helper function to handle return data from Futu API
     
@@ -651,21 +1118,17 @@ def handle_return_data(ret: int, data: Any) -> Dict[str, Any]:
     Returns:
         Dict containing either the data or error message
     """
-    if ret != RET_OK:
-        return {'error': str(data)}
+    if ret != futu.RET_OK:
+        return error_response(data)
     
+    # If data is a pandas DataFrame, convert to columnar dict
+    if isinstance(data, pd.DataFrame):
+        return df_to_columnar(data)
+
     # If data is already a dict, return it directly
     if isinstance(data, dict):
         return data
-    
-    # If data has to_dict method, call it
-    if hasattr(data, 'to_dict'):
-        return data.to_dict()
-    
-    # If data is a pandas DataFrame, convert to dict
-    if hasattr(data, 'to_dict') and callable(getattr(data, 'to_dict')):
-        return data.to_dict('records')
-    
+
     # For other types, try to convert to dict or return as is
     try:
         return dict(data)
@@ -674,11 +1137,11 @@ def handle_return_data(ret: int, data: Any) -> Dict[str, Any]:
 
 # Market Data Tools
 @mcp.tool()
-async def get_stock_quote(symbols: List[str], ctx: Context[ServerSession, None] = None) -> Dict[str, Any]:
+async def get_stock_quote(symbols: SymbolList, ctx: Context[ServerSession, None] = None) -> Dict[str, Any]:
     """Get stock quote data for given symbols
     
     Args:
-        symbols: List of stock codes, e.g. ["HK.00700", "US.AAPL", "SH.600519"]
+        symbols: List of stock codes (1-400), e.g. ["HK.00700", "US.AAPL", "SH.600519"]
             Format: {market}.{code}
             - HK: Hong Kong stocks
             - US: US stocks
@@ -687,7 +1150,8 @@ async def get_stock_quote(symbols: List[str], ctx: Context[ServerSession, None]
     
     Returns:
         Dict containing quote data including:
-        - quote_list: List of quote data entries, each containing:
+        - quote_list: Columnar quote data with 'columns' (field names) and
+          'data' (field name -> list of values, one per symbol). Fields:
             - code: Stock code
             - update_time: Update time (YYYY-MM-DD HH:mm:ss)
             - last_price: Latest price
@@ -718,39 +1182,31 @@ async def get_stock_quote(symbols: List[str], ctx: Context[ServerSession, None]
         - Consider actual needs when selecting stocks
         - Handle exceptions properly
     """
-    safe_log("info", f"Getting stock quotes for symbols: {symbols}", ctx)
+    safe_log("info", "Getting stock quotes for symbols: %s", symbols, ctx=ctx)
     
     try:
-        ret, data = quote_ctx.get_stock_quote(symbols)
-        if ret != RET_OK:
+        ret, data = await futu_call(quote_ctx.get_stock_quote, symbols)
+        if ret != futu.RET_OK:
             error_msg = f"Failed to get stock quote: {str(data)}"
-            safe_log("error", error_msg, ctx)
+            safe_log("error", error_msg, ctx=ctx)
             return {'error': error_msg}
     
-        # Convert DataFrame to dict if necessary
-        if hasattr(data, 'to_dict'):
-            result = {
-                'quote_list': data.to_dict('records')
-            }
-        else:
-            result = {
-                'quote_list': data
-            }
+        result = wrap_frame('quote_list', data, df_to_columnar)
 
-        safe_log("info", f"Successfully retrieved quotes for {len(symbols)} symbols", ctx)
+        safe_log("info", "Successfully retrieved quotes for %d symbols", len(symbols), ctx=ctx)
         return result
 
     except Exception as e:
         error_msg = f"Exception in get_stock_quote: {str(e)}"
-        safe_log("error", error_msg, ctx)
+        safe_log("error", error_msg, ctx=ctx)
         return {'error': error_msg}
 
 @mcp.tool()
-async def get_market_snapshot(symbols: List[str]) -> Dict[str, Any]:
+async def get_market_snapshot(symbols: SymbolList) -> Dict[str, Any]:
     """Get market snapshot for given symbols
     
     Args:
-        symbols: List of stock codes, e.g. ["HK.00700", "US.AAPL", "SH.600519"]
+        symbols: List of stock codes (1-400), e.g. ["HK.00700", "US.AAPL", "SH.600519"]
             Format: {market}.{code}
             - HK: Hong Kong stocks
             - US: US stocks
@@ -759,7 +1215,8 @@ async def get_market_snapshot(symbols: List[str]) -> Dict[str, Any]:
     
     Returns:
         Dict containing snapshot data including:
-        - snapshot_list: List of snapshot data entries, each containing:
+        - snapshot_list: Columnar snapshot data with 'columns' (field names) and
+          'data' (field name -> list of values, one per symbol). Fields:
             - code: Stock code
             - update_time: Update time (YYYY-MM-DD HH:mm:ss)
             - last_price: Latest price
@@ -794,23 +1251,14 @@ async def get_market_snapshot(symbols: List[str]) -> Dict[str, Any]:
         - Consider actual needs when selecting stocks
         - Handle exceptions properly
     """
-    ret, data = quote_ctx.get_market_snapshot(symbols)
-    if ret != RET_OK:
-        return {'error': str(data)}
+    ret, data = await futu_call(quote_ctx.get_market_snapshot, symbols)
+    if ret != futu.RET_OK:
+        return error_response(data)
     
-    # Convert DataFrame to dict if necessary
-    if hasattr(data, 'to_dict'):
-        result = {
-            'snapshot_list': data.to_dict('records')
-        }
-    else:
-        result = {
-            'snapshot_list': data
-        }
-    
-    return result
+    return wrap_frame('snapshot_list', data, df_to_columnar)
 
 @mcp.tool()
+@doc_tables
 async def get_cur_kline(symbol: str, ktype: str, count: int = 100) -> Dict[str, Any]:
     """Get current K-line data
     
@@ -822,16 +1270,7 @@ async def get_cur_kline(symbol: str, ktype: str, count: int = 100) -> Dict[str,
             - SH: Shanghai stocks
             - SZ: Shenzhen stocks
         ktype: K-line type, options:
-            - "K_1M": 1 minute
-            - "K_5M": 5 minutes
-            - "K_15M": 15 minutes
-            - "K_30M": 30 minutes
-            - "K_60M": 60 minutes
-            - "K_DAY": Daily
-            - "K_WEEK": Weekly
-            - "K_MON": Monthly
-            - "K_QUARTER": Quarterly
-            - "K_YEAR": Yearly
+            {KTYPES}
         count: Number of K-lines to return (default: 100)
             Range: 1-1000
     
@@ -866,27 +1305,22 @@ async def get_cur_kline(symbol: str, ktype: str, count: int = 100) -> Dict[str,
         - Consider actual needs when selecting stocks and K-line types
         - Handle exceptions properly
     """
-    ret, data = quote_ctx.get_cur_kline(
+    if ktype not in KL_TYPES:
+        return {'error': f"Invalid K-line type: {ktype}"}
+
+    ret, data = await futu_call(
+        quote_ctx.get_cur_kline,
         code=symbol,
         ktype=ktype,
         num=count
     )
-    if ret != RET_OK:
-        return {'error': str(data)}
+    if ret != futu.RET_OK:
+        return error_response(data)
     
-    # Convert DataFrame to dict if necessary
-    if hasattr(data, 'to_dict'):
-        result = {
-            'kline_list': data.to_dict('records')
-        }
-    else:
-        result = {
-            'kline_list': data
-        }
-    
-    return result
+    return wrap_frame('kline_list', data, df_to_records)
 
 @mcp.tool()
+@doc_tables
 async def get_history_kline(symbol: str, ktype: str, start: str, end: str, count: int = 100) -> Dict[str, Any]:
     """Get historical K-line data
     
@@ -898,15 +1332,7 @@ async def get_history_kline(symbol: str, ktype: str, start: str, end: str, count
             - SH: Shanghai stocks
             - SZ: Shenzhen stocks
         ktype: K-line type, options:
-            - "K_1M": 1 minute
-            - "K_3M": 3 minutes
-            - "K_5M": 5 minutes
-            - "K_15M": 15 minutes
-            - "K_30M": 30 minutes
-            - "K_60M": 60 minutes
-            - "K_DAY": Daily
-            - "K_WEEK": Weekly
-            - "K_MON": Monthly
+            {KTYPES}
         start: Start date in format "YYYY-MM-DD"
         end: End date in format "YYYY-MM-DD"
         count: Number of K-lines to return (default: 100)
@@ -940,22 +1366,46 @@ async def get_history_kline(symbol: str, ktype: str, start: str, end: str, count
         - INVALID_SUBTYPE: Invalid K-line type
         - GET_HISTORY_KLINE_FAILED: Failed to get historical K-line data
     """
-    ret, data, page_req_key = quote_ctx.request_history_kline(
+    if ktype not in KL_TYPES:
+        return {'error': f"Invalid K-line type: {ktype}"}
+
+    windows = split_date_range(start, end, HISTORY_KLINE_WINDOWS if ktype in INTRADAY_KL_TYPES else 1)
+    results = await asyncio.gather(
+        *(fetch_history_kline_window(symbol, ktype, w_start, w_end, count) for w_start, w_end in windows)
+    )
+    frames = []
+    for ret, data in results:
+        if ret != futu.RET_OK:
+            return error_response(data)
+        frames.extend(data)
+    
+    # Windows are disjoint and gathered in order, so the concatenated
+    # pages are already sorted by time_key. Convert to lists once.
+    full = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True, copy=False)
+    return {col: full[col].tolist() for col in full.columns}
+
+async def fetch_history_kline_window(symbol: str, ktype: str, start: str, end: str, count: int):
+    """Fetch every page of history K-lines for one date window
+
+    Returns:
+        (futu.RET_OK, list of page DataFrames) or (error code, error message)
+    """
+    ret, data, page_req_key = await futu_call(
+        quote_ctx.request_history_kline,
         code=symbol,
         start=start,
         end=end,
         ktype=ktype,
         max_count=count
     )
-    
-    if ret != RET_OK:
-        return {'error': data}
-    
-    result = data.to_dict()
-    
-    # If there are more pages, continue fetching
+    if ret != futu.RET_OK:
+        return ret, data
+    frames = [data]
+
+    # Each page needs the key returned by the previous one
     while page_req_key is not None:
-        ret, data, page_req_key = quote_ctx.request_history_kline(
+        ret, data, page_req_key = await futu_call(
+            quote_ctx.request_history_kline,
             code=symbol,
             start=start,
             end=end,
@@ -963,15 +1413,30 @@ async def get_history_kline(symbol: str, ktype: str, start: str, end: str, count
             max_count=count,
             page_req_key=page_req_key
         )
-        if ret != RET_OK:
-            return {'error': data}
-        # Append new data to result
-        new_data = data.to_dict()
-        for key in result:
-            if isinstance(result[key], list):
-                result[key].extend(new_data[key])
-    
-    return result
+        if ret != futu.RET_OK:
+            return ret, data
+        frames.append(data)
+    return futu.RET_OK, frames
+
+def split_date_range(start: str, end: str, windows: int) -> List[tuple]:
+    """Split an inclusive "YYYY-MM-DD" range into up to `windows` consecutive day ranges
+
+    Falls back to the original range when the dates cannot be parsed.
+    """
+    try:
+        first = date.fromisoformat(start)
+        last = date.fromisoformat(end)
+    except (TypeError, ValueError):
+        return [(start, end)]
+    days = (last - first).days + 1
+    windows = min(windows, days)
+    if windows <= 1:
+        return [(start, end)]
+    bounds = [first + timedelta(days=days * i // windows) for i in range(windows + 1)]
+    return [
+        (bounds[i].isoformat(), (bounds[i + 1] - timedelta(days=1)).isoformat())
+        for i in range(windows)
+    ]
 
 @mcp.tool()
 async def get_rt_data(symbol: str) -> Dict[str, Any]:
@@ -1009,21 +1474,11 @@ async def get_rt_data(symbol: str) -> Dict[str, Any]:
         - Update frequency varies by market and stock
         - Consider using callbacks for real-time processing
     """
-    ret, data = quote_ctx.get_rt_data(symbol)
-    if ret != RET_OK:
-        return {'error': str(data)}
-    
-    # Convert DataFrame to dict if necessary
-    if hasattr(data, 'to_dict'):
-        result = {
-            'rt_data_list': data.to_dict('records')
-        }
-    else:
-        result = {
-            'rt_data_list': data
-        }
+    ret, data = await futu_call(quote_ctx.get_rt_data, symbol)
+    if ret != futu.RET_OK:
+        return error_response(data)
     
-    return result
+    return wrap_frame('rt_data_list', data, df_to_records)
 
 @mcp.tool()
 async def get_ticker(symbol: str) -> Dict[str, Any]:
@@ -1038,24 +1493,16 @@ async def get_ticker(symbol: str) -> Dict[str, Any]:
             - SZ: Shenzhen stocks
     
     Returns:
-        Dict containing ticker data including:
-        - code: Stock code
-        - sequence: Sequence number
-        - price: Deal price
-        - volume: Deal volume
-        - turnover: Deal amount
-        - ticker_direction: Ticker direction
-            1: Bid order
-            2: Ask order
-            3: Neutral order
-        - ticker_type: Ticker type
-            1: Regular trade
-            2: Cancel trade
-            3: Trading at closing price
-            4: Off-exchange trade
-            5: After-hours trade
-        - timestamp: Deal time (YYYY-MM-DD HH:mm:ss)
-        - ticker_status: Ticker status (0: Normal)
+        Columnar ticker data with 'columns' (field names) and 'data'
+        (field name -> list of values, one per trade). Fields:
+            - code: Stock code
+            - sequence: Sequence number
+            - time: Deal time (YYYY-MM-DD HH:mm:ss)
+            - price: Deal price
+            - volume: Deal volume
+            - turnover: Deal amount
+            - ticker_direction: Ticker direction ("BUY", "SELL", "NEUTRAL")
+            - type: Ticker type, see futu TickerType
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1069,7 +1516,7 @@ async def get_ticker(symbol: str) -> Dict[str, Any]:
         - Update frequency varies by market and stock
         - Consider using callbacks for real-time processing
     """
-    ret, data = quote_ctx.get_ticker(symbol)
+    ret, data = await futu_call(quote_ctx.get_rt_ticker, symbol)
     return handle_return_data(ret, data)
 
 @mcp.tool()
@@ -1085,13 +1532,14 @@ async def get_order_book(symbol: str) -> Dict[str, Any]:
             - SZ: Shenzhen stocks
     
     Returns:
-        Dict containing order book data including:
+        Dict containing order book data (the SDK returns a dict, not a
+        table, so this is not columnar):
         - code: Stock code
-        - update_time: Update time (YYYY-MM-DD HH:mm:ss)
-        - bid_price: List of bid prices (up to 10 levels)
-        - bid_volume: List of bid volumes (up to 10 levels)
-        - ask_price: List of ask prices (up to 10 levels)
-        - ask_volume: List of ask volumes (up to 10 levels)
+        - name: Stock name
+        - svr_recv_time_bid: Server receive time of the bid side
+        - svr_recv_time_ask: Server receive time of the ask side
+        - Bid: Bid levels (up to 10), each [price, volume, order count, order details]
+        - Ask: Ask levels (up to 10), each [price, volume, order count, order details]
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1105,7 +1553,7 @@ async def get_order_book(symbol: str) -> Dict[str, Any]:
         - Number of price levels may vary by market
         - Update frequency varies by market and stock
     """
-    ret, data = quote_ctx.get_order_book(symbol)
+    ret, data = await futu_call(quote_ctx.get_order_book, symbol)
     return handle_return_data(ret, data)
 
 @mcp.tool()
@@ -1121,17 +1569,18 @@ async def get_broker_queue(symbol: str) -> Dict[str, Any]:
             - SZ: Shenzhen stocks
     
     Returns:
-        Dict containing broker queue data including:
-        - code: Stock code
-        - update_time: Update time (YYYY-MM-DD HH:mm:ss)
-        - bid_broker_id: List of bid broker IDs
-        - bid_broker_name: List of bid broker names
-        - bid_broker_pos: List of bid broker positions
-        - ask_broker_id: List of ask broker IDs
-        - ask_broker_name: List of ask broker names
-        - ask_broker_pos: List of ask broker positions
-        - timestamp: Update timestamp
-        - broker_status: Broker queue status (0: Normal)
+        Dict containing:
+        - bid: Columnar bid-side queue with 'columns' (field names) and
+          'data' (field name -> list of values, one per broker). Fields:
+            - code: Stock code
+            - name: Stock name
+            - bid_broker_id: Broker ID
+            - bid_broker_name: Broker name
+            - bid_broker_pos: Queue position
+            - order_id: Order ID (SF quote users only)
+            - order_volume: Order volume (SF quote users only)
+        - ask: Columnar ask-side queue in the same layout, with
+          ask_broker_id/ask_broker_name/ask_broker_pos
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1146,10 +1595,59 @@ async def get_broker_queue(symbol: str) -> Dict[str, Any]:
         - Update frequency varies by market and stock
         - Mainly used for displaying broker trading activities
     """
-    ret, data = quote_ctx.get_broker_queue(symbol)
-    return handle_return_data(ret, data)
+    # Succeeds with (ret, bid_frame, ask_frame), fails with (ret, msg, msg)
+    ret, bid, ask = await futu_call(quote_ctx.get_broker_queue, symbol)
+    if ret != futu.RET_OK:
+        return error_response(bid)
+    return {'bid': df_to_columnar(bid), 'ask': df_to_columnar(ask)}
+
+def batch_error_names_symbol(batch_error: Any, symbols: List[str]) -> bool:
+    """Whether a failed batch call's error is about one of its codes
+
+    Both the SDK's code format check and OpenD name the offending code in
+    the message. Quota, throttling, timing rules and disconnects do not, and
+    retrying those per code would only multiply the failing requests.
+    """
+    message = str(batch_error)
+    return any(symbol in message for symbol in symbols)
+
+async def fan_out_subscription(fn, symbols: List[str], sub_types: List[str], batch_error: Any) -> Dict[str, Any]:
+    """Retry a failed batch (un)subscribe per symbol/type pair, concurrently
+
+    A single bad code fails the whole batch request, so when the batch error
+    names one of the codes the pairs are retried individually to apply the
+    valid ones and report exactly which pairs failed. Concurrency is bounded
+    by the Futu worker pool. Any other batch error is returned as-is.
+
+    Args:
+        fn: quote_ctx.subscribe or quote_ctx.unsubscribe
+        symbols: Stock codes from the batch request
+        sub_types: Subscription types from the batch request
+        batch_error: Error returned by the batch request
+
+    Returns:
+        {"status": "success"} if every pair succeeded, otherwise the batch error
+        plus a 'failed' map of "symbol:sub_type" -> error message
+    """
+    if len(symbols) * len(sub_types) <= 1 or not batch_error_names_symbol(batch_error, symbols):
+        return error_response(batch_error)
+
+    async def call(symbol, sub_type):
+        ret, data = await futu_call(fn, [symbol], [sub_type])
+        return symbol, sub_type, ret, data
+
+    results = await asyncio.gather(*[call(s, t) for s in symbols for t in sub_types])
+    failed = {
+        f"{symbol}:{sub_type}": str(data)
+        for symbol, sub_type, ret, data in results
+        if ret != futu.RET_OK
+    }
+    if not failed:
+        return {"status": "success"}
+    return {**error_response(batch_error), 'failed': failed}
 
 @mcp.tool()
+@doc_tables
 async def subscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any]:
     """Subscribe to real-time data
     
@@ -1161,22 +1659,7 @@ async def subscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any]:
             - SH: Shanghai stocks
             - SZ: Shenzhen stocks
         sub_types: List of subscription types, options:
-            - "QUOTE": Basic quote (price, volume, etc.)
-            - "ORDER_BOOK": Order book (bid/ask)
-            - "TICKER": Ticker (trades)
-            - "RT_DATA": Real-time data
-            - "BROKER": Broker queue
-            - "K_1M": 1-minute K-line
-            - "K_3M": 3-minute K-line
-            - "K_5M": 5-minute K-line
-            - "K_15M": 15-minute K-line
-            - "K_30M": 30-minute K-line
-            - "K_60M": 60-minute K-line
-            - "K_DAY": Daily K-line
-            - "K_WEEK": Weekly K-line
-            - "K_MON": Monthly K-line
-            - "K_QUARTER": Quarterly K-line
-            - "K_YEAR": Yearly K-line
+            {SUBTYPES}
     
     Note:
         - Maximum 100 symbols per request
@@ -1195,14 +1678,18 @@ async def subscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any]:
         - INVALID_SUBTYPE: Invalid subscription type
         - SUBSCRIBE_FAILED: Failed to subscribe
     """
-    for symbol in symbols:
-        for sub_type in sub_types:
-            ret, data = quote_ctx.subscribe(symbol, sub_type)
-            if ret != RET_OK:
-                return {'error': data}
+    invalid = [t for t in sub_types if t not in SUB_TYPES]
+    if invalid:
+        return {'error': f"Invalid subscription type(s): {invalid}"}
+
+    # One request for all symbols and types instead of one per pair
+    ret, data = await futu_call(quote_ctx.subscribe, symbols, sub_types)
+    if ret != futu.RET_OK:
+        return await fan_out_subscription(quote_ctx.subscribe, symbols, sub_types, data)
     return {"status": "success"}
 
 @mcp.tool()
+@doc_tables
 async def unsubscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any]:
     """Unsubscribe from real-time data
     
@@ -1214,19 +1701,7 @@ async def unsubscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any
             - SH: Shanghai stocks
             - SZ: Shenzhen stocks
         sub_types: List of subscription types, options:
-            - "QUOTE": Basic quote (price, volume, etc.)
-            - "ORDER_BOOK": Order book (bid/ask)
-            - "TICKER": Ticker (trades)
-            - "RT_DATA": Real-time data
-            - "BROKER": Broker queue
-            - "K_1M": 1-minute K-line
-            - "K_5M": 5-minute K-line
-            - "K_15M": 15-minute K-line
-            - "K_30M": 30-minute K-line
-            - "K_60M": 60-minute K-line
-            - "K_DAY": Daily K-line
-            - "K_WEEK": Weekly K-line
-            - "K_MON": Monthly K-line
+            {SUBTYPES}
             
     Returns:
         Dict containing unsubscription result:
@@ -1238,11 +1713,14 @@ async def unsubscribe(symbols: List[str], sub_types: List[str]) -> Dict[str, Any
         - INVALID_SUBTYPE: Invalid subscription type
         - UNSUBSCRIBE_FAILED: Failed to unsubscribe
     """
-    for symbol in symbols:
-        for sub_type in sub_types:
-            ret, data = quote_ctx.unsubscribe(symbol, sub_type)
-            if ret != RET_OK:
-                return {'error': data}
+    invalid = [t for t in sub_types if t not in SUB_TYPES]
+    if invalid:
+        return {'error': f"Invalid subscription type(s): {invalid}"}
+
+    # One request for all symbols and types instead of one per pair
+    ret, data = await futu_call(quote_ctx.unsubscribe, symbols, sub_types)
+    if ret != futu.RET_OK:
+        return await fan_out_subscription(quote_ctx.unsubscribe, symbols, sub_types, data)
     return {"status": "success"}
 
 # Derivatives Tools
@@ -1255,28 +1733,24 @@ async def get_option_chain(symbol: str, start: str, end: str) -> Dict[str, Any]:
             Format: {market}.{code}
             - HK: Hong Kong stocks
             - US: US stocks
-        start: Start date in format "YYYY-MM-DD"
-        end: End date in format "YYYY-MM-DD"
+        start: Start of the expiry date range, format "YYYY-MM-DD"
+        end: End of the expiry date range (inclusive), format "YYYY-MM-DD";
+            the range may span at most 30 days
     
     Returns:
-        Dict containing option chain data including:
-        - stock_code: Underlying stock code
-        - stock_name: Underlying stock name
-        - option_list: List of option contracts, each containing:
-            - option_code: Option code
-            - option_name: Option name
+        Columnar option chain data with 'columns' (field names) and 'data'
+        (field name -> list of values, one per contract). Fields:
+            - code: Option code
+            - name: Option name
+            - lot_size: Contracts per lot
+            - stock_type: Security type (DRVT)
             - option_type: Option type (CALL/PUT)
+            - stock_owner: Underlying stock code
+            - strike_time: Expiry date
             - strike_price: Strike price
-            - expiry_date: Expiry date
-            - last_price: Latest price
-            - volume: Trading volume
-            - open_interest: Open interest
-            - implied_volatility: Implied volatility
-            - delta: Delta value
-            - gamma: Gamma value
-            - theta: Theta value
-            - vega: Vega value
-            - update_time: Update time
+            - suspension: Whether trading is suspended
+            - stock_id: Security ID
+            - index_option_type: Index option type
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1288,14 +1762,15 @@ async def get_option_chain(symbol: str, start: str, end: str) -> Dict[str, Any]:
     Note:
         - Option chain data is essential for options trading
         - Contains both call and put options
-        - Includes Greeks for risk management
+        - Quotes and Greeks are not included; fetch them per contract
         - Data is updated during trading hours
         - Consider using with option expiration dates API
     """
-    ret, data = quote_ctx.get_option_chain(symbol, start, end)
-    return data.to_dict() if ret == RET_OK else {'error': data}
+    ret, data = await futu_call(quote_ctx.get_option_chain, symbol, start=start, end=end)
+    return df_to_payload(data) if ret == futu.RET_OK else error_response(data)
 
 @mcp.tool()
+@ttl_cache(ttl=300)
 async def get_option_expiration_date(symbol: str) -> Dict[str, Any]:
     """Get option expiration dates
     
@@ -1306,9 +1781,11 @@ async def get_option_expiration_date(symbol: str) -> Dict[str, Any]:
             - US: US stocks
     
     Returns:
-        Dict containing expiration dates:
-        - strike_time: List of expiration dates in format "YYYY-MM-DD"
-        - option_expiry_info: Additional expiry information
+        Columnar expiry data with 'columns' (field names) and 'data'
+        (field name -> list of values, one per expiry date). Fields:
+            - strike_time: Expiry date in format "YYYY-MM-DD"
+            - option_expiry_date_distance: Days until expiry (negative once expired)
+            - expiration_cycle: Expiration cycle (HK index options only)
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1322,117 +1799,52 @@ async def get_option_expiration_date(symbol: str) -> Dict[str, Any]:
         - Expiry dates are typically on monthly/weekly cycles
         - Not all stocks have listed options
     """
-    ret, data = quote_ctx.get_option_expiration_date(symbol)
-    return data.to_dict() if ret == RET_OK else {'error': data}
-
-@mcp.tool()
-async def get_option_condor(symbol: str, expiry: str, strike_price: float) -> Dict[str, Any]:
-    """Get option condor strategy data
-    
-    Args:
-        symbol: Stock code, e.g. "HK.00700", "US.AAPL"
-            Format: {market}.{code}
-            - HK: Hong Kong stocks
-            - US: US stocks
-        expiry: Option expiration date in format "YYYY-MM-DD"
-        strike_price: Strike price of the option
-        
-    Returns:
-        Dict containing condor strategy data including:
-        - strategy_name: Strategy name
-        - option_list: List of options in the strategy
-        - risk_metrics: Risk metrics for the strategy
-        - profit_loss: Profit/loss analysis
-        
-    Raises:
-        - INVALID_PARAM: Invalid parameter
-        - INVALID_MARKET: Invalid market code
-        - INVALID_STOCKCODE: Invalid stock code
-        - INVALID_EXPIRYDATE: Invalid expiry date
-        - INVALID_STRIKEPRICE: Invalid strike price
-        - GET_OPTION_CONDOR_FAILED: Failed to get condor data
-        
-    Note:
-        - Condor is a neutral options trading strategy
-        - Involves four different strike prices
-        - Limited risk and limited profit potential
-        - Best used in low volatility environments
-    """
-    ret, data = quote_ctx.get_option_condor(symbol, expiry, strike_price)
-    return data.to_dict() if ret == RET_OK else {'error': data}
-
-@mcp.tool()
-async def get_option_butterfly(symbol: str, expiry: str, strike_price: float) -> Dict[str, Any]:
-    """Get option butterfly strategy data
-    
-    Args:
-        symbol: Stock code, e.g. "HK.00700", "US.AAPL"
-            Format: {market}.{code}
-            - HK: Hong Kong stocks
-            - US: US stocks
-        expiry: Option expiration date in format "YYYY-MM-DD"
-        strike_price: Strike price of the option
-        
-    Returns:
-        Dict containing butterfly strategy data including:
-        - strategy_name: Strategy name
-        - option_list: List of options in the strategy
-        - risk_metrics: Risk metrics for the strategy
-        - profit_loss: Profit/loss analysis
-        
-    Raises:
-        - INVALID_PARAM: Invalid parameter
-        - INVALID_MARKET: Invalid market code
-        - INVALID_STOCKCODE: Invalid stock code
-        - INVALID_EXPIRYDATE: Invalid expiry date
-        - INVALID_STRIKEPRICE: Invalid strike price
-        - GET_OPTION_BUTTERFLY_FAILED: Failed to get butterfly data
-        
-    Note:
-        - Butterfly is a neutral options trading strategy
-        - Involves three different strike prices
-        - Limited risk and limited profit potential
-        - Maximum profit at middle strike price
-        - Best used when expecting low volatility
-    """
-    ret, data = quote_ctx.get_option_butterfly(symbol, expiry, strike_price)
-    return data.to_dict() if ret == RET_OK else {'error': data}
+    ret, data = await futu_call(quote_ctx.get_option_expiration_date, symbol)
+    return df_to_payload(data) if ret == futu.RET_OK else error_response(data)
 
 # Account Query Tools
 @mcp.tool()
 async def get_account_list(ctx: Context[ServerSession, None] = None) -> Dict[str, Any]:
     """Get account list"""
-    safe_log("info", "Attempting to get account list", ctx)
+    safe_log("info", "Attempting to get account list", ctx=ctx)
 
-    if not init_trade_connection():
+    if not await futu_call(init_trade_connection):
         error_msg = 'Failed to initialize trade connection'
-        safe_log("error", error_msg, ctx)
+        safe_log("error", error_msg, ctx=ctx)
         return {'error': error_msg}
 
     try:
-        ret, data = trade_ctx.get_acc_list()
+        ret, data = await futu_call(trade_ctx.get_acc_list)
         result = handle_return_data(ret, data)
 
         if 'error' not in result:
-            safe_log("info", "Successfully retrieved account list", ctx)
+            safe_log("info", "Successfully retrieved account list", ctx=ctx)
         else:
-            safe_log("error", f"Failed to get account list: {result['error']}", ctx)
+            safe_log("error", "Failed to get account list: %s", result['error'], ctx=ctx)
 
         return result
     except Exception as e:
         error_msg = f"Exception in get_account_list: {str(e)}"
-        safe_log("error", error_msg, ctx)
+        safe_log("error", error_msg, ctx=ctx)
         return {'error': error_msg}
 
 @mcp.tool()
 async def get_funds() -> Dict[str, Any]:
-    """Get account funds information"""
-    if not init_trade_connection():
+    """Get account funds information
+
+    Returns:
+        Columnar funds data with 'columns' (field names) and 'data'
+        (field name -> list of values, one per account row). Fields include
+        power, max_power_short, net_cash_power, total_assets, cash,
+        market_val, frozen_cash, avl_withdrawal_cash, currency,
+        unrealized_pl, realized_pl and per-currency cash/asset fields.
+    """
+    if not await futu_call(init_trade_connection):
         return {'error': 'Failed to initialize trade connection'}
     try:
-        ret, data = trade_ctx.accinfo_query()
-        if ret != RET_OK:
-            return {'error': str(data)}
+        ret, data = await futu_call(trade_ctx.accinfo_query)
+        if ret != futu.RET_OK:
+            return error_response(data)
         
         if data is None or data.empty:
             return {'error': 'No account information available'}
@@ -1443,43 +1855,142 @@ async def get_funds() -> Dict[str, Any]:
 
 @mcp.tool()
 async def get_positions() -> Dict[str, Any]:
-    """Get account positions"""
-    if not init_trade_connection():
+    """Get account positions
+
+    Returns:
+        Columnar position data with 'columns' (field names) and 'data'
+        (field name -> list of values, one per position). Fields include
+        code, stock_name, position_market, qty, can_sell_qty, cost_price,
+        nominal_price, market_val, pl_ratio, pl_val, today_pl_val,
+        position_side, unrealized_pl, realized_pl and currency.
+    """
+    if not await futu_call(init_trade_connection):
         return {'error': 'Failed to initialize trade connection'}
-    ret, data = trade_ctx.position_list_query()
+    ret, data = await futu_call(trade_ctx.position_list_query)
     return handle_return_data(ret, data)
 
 @mcp.tool()
-async def get_max_power() -> Dict[str, Any]:
-    """Get maximum trading power for the account"""
-    if not init_trade_connection():
+async def get_max_power(symbol: str, price: float) -> Dict[str, Any]:
+    """Get maximum trading power for the account
+
+    Args:
+        symbol: Stock code, e.g. "HK.00700", "US.AAPL"
+        price: Order price to evaluate the buy/sell quantities at
+
+    Returns:
+        Columnar data with 'columns' (field names) and 'data' (field name ->
+        list of values, a single row for a normal order). Fields:
+            - max_cash_buy: Maximum quantity buyable with cash
+            - max_cash_and_margin_buy: Maximum quantity buyable with cash and margin
+            - max_position_sell: Maximum quantity sellable from the position
+            - max_sell_short: Maximum short-sell quantity
+            - max_buy_back: Quantity needed to close a short position
+            - long_required_im: Initial margin required per long share
+            - short_required_im: Initial margin required per short share
+    """
+    if not await futu_call(init_trade_connection):
         return {'error': 'Failed to initialize trade connection'}
-    ret, data = trade_ctx.get_max_power()
+    ret, data = await futu_call(
+        trade_ctx.acctradinginfo_query, order_type='NORMAL', code=symbol, price=price
+    )
     return handle_return_data(ret, data)
 
 @mcp.tool()
 async def get_margin_ratio(symbol: str) -> Dict[str, Any]:
     """Get margin ratio for a security"""
-    if not init_trade_connection():
+    if not await futu_call(init_trade_connection):
         return {'error': 'Failed to initialize trade connection'}
-    ret, data = trade_ctx.get_margin_ratio(symbol)
+    ret, data = await futu_call(trade_ctx.get_margin_ratio, symbol)
     return handle_return_data(ret, data)
 
+# OpenD accepts at most 100 codes per get_margin_ratio request
+MARGIN_RATIO_MAX_CODES = 100
+MarginSymbolList = Annotated[List[str], Field(min_length=1, max_length=MARGIN_RATIO_MAX_CODES)]
+
+async def fetch_margin_ratios(symbols: List[str]):
+    """Query margin ratios for codes of a single market
+
+    Returns:
+        (list of DataFrames, map of symbol -> error message, batch error or None)
+    """
+    ret, data = await futu_call(trade_ctx.get_margin_ratio, symbols)
+    if ret == futu.RET_OK:
+        return [data], {}, None
+    batch_error = data
+    if len(symbols) == 1 or not batch_error_names_symbol(batch_error, symbols):
+        return [], {symbol: str(batch_error) for symbol in symbols}, batch_error
+
+    # A bad code fails the whole batch; retry each code to isolate it
+    results = await asyncio.gather(
+        *(futu_call(trade_ctx.get_margin_ratio, [symbol]) for symbol in symbols)
+    )
+    frames = []
+    failed = {}
+    for symbol, (ret, data) in zip(symbols, results):
+        if ret == futu.RET_OK:
+            frames.append(data)
+        else:
+            failed[symbol] = str(data)
+    return frames, failed, batch_error
+
+@mcp.tool()
+async def get_margin_ratios(symbols: MarginSymbolList) -> Dict[str, Any]:
+    """Get margin ratios for several securities at once
+
+    Args:
+        symbols: List of stock codes, e.g. ["HK.00700", "HK.09988"], at most 100
+
+    Returns:
+        Dict containing:
+        - margin_ratio_list: One margin ratio record per security
+        - failed: Map of symbol -> error message, present only when some
+          symbols could not be queried
+
+    Note:
+        - The SDK picks the trading market from the first code, so codes are
+          grouped by market prefix and each market is queried in one request
+        - Codes are only retried one by one when the batch error names one of
+          them (e.g. an invalid code); throttling or connection errors are
+          reported for the whole market instead
+    """
+    if not await futu_call(init_trade_connection):
+        return {'error': 'Failed to initialize trade connection'}
+
+    by_market = {}
+    for symbol in symbols:
+        by_market.setdefault(symbol.split('.', 1)[0], []).append(symbol)
+    results = await asyncio.gather(*(fetch_margin_ratios(codes) for codes in by_market.values()))
+
+    frames = []
+    failed = {}
+    batch_error = None
+    for market_frames, market_failed, market_error in results:
+        frames.extend(market_frames)
+        failed.update(market_failed)
+        if batch_error is None:
+            batch_error = market_error
+    if not frames:
+        return {**error_response(batch_error), 'failed': failed}
+
+    full = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True, copy=False)
+    result = {'margin_ratio_list': df_to_records(full)}
+    if failed:
+        result['failed'] = failed
+    return result
+
 # Market Information Tools
 @mcp.tool()
-async def get_market_state(market: str) -> Dict[str, Any]:
+async def get_market_state(symbols: SymbolList) -> Dict[str, Any]:
     """Get market state
     
     Args:
-        market: Market code, options:
-            - "HK": Hong Kong market (includes pre-market, continuous trading, afternoon, closing auction)
-            - "US": US market (includes pre-market, continuous trading, after-hours)
-            - "SH": Shanghai market (includes pre-opening, morning, afternoon, closing auction)
-            - "SZ": Shenzhen market (includes pre-opening, morning, afternoon, closing auction)
+        symbols: List of stock codes, e.g. ["HK.00700", "US.AAPL"]
+            Format: {market}.{code}; the state of each code's market is returned
     
     Returns:
-        Dict containing market state information including:
-        - market: Market code
+        Dict containing market state information, one row per code:
+        - code: Stock code
+        - stock_name: Stock name
         - market_state: Market state code
             - NONE: Market not available
             - AUCTION: Auction period
@@ -1492,12 +2003,10 @@ async def get_market_state(market: str) -> Dict[str, Any]:
             - PRE_MARKET_END: Pre-market end
             - AFTER_HOURS_BEGIN: After-hours begin
             - AFTER_HOURS_END: After-hours end
-        - market_state_desc: Description of market state
-        - update_time: Update time (YYYY-MM-DD HH:mm:ss)
         
     Raises:
         - INVALID_PARAM: Invalid parameter
-        - INVALID_MARKET: Invalid market code
+        - INVALID_CODE: Invalid stock code format
         - GET_MARKET_STATE_FAILED: Failed to get market state
         
     Note:
@@ -1507,43 +2016,36 @@ async def get_market_state(market: str) -> Dict[str, Any]:
         - Market state affects trading operations
         - Recommended to check state before trading
     """
-    ret, data = quote_ctx.get_market_state(market)
-    return data.to_dict() if ret == RET_OK else {'error': data}
+    invalid = [symbol for symbol in symbols if symbol.split('.', 1)[0] not in MARKETS]
+    if invalid:
+        return {'error': f"Invalid stock code(s): {invalid}"}
+    ret, data = await futu_call(quote_ctx.get_market_state, symbols)
+    return df_to_payload(data) if ret == futu.RET_OK else error_response(data)
 
 @mcp.tool()
+@ttl_cache(ttl=300)
+@doc_tables
 async def get_security_info(market: str, code: str) -> Dict[str, Any]:
     """Get security information
     
     Args:
         market: Market code, options:
-            - "HK": Hong Kong market
-            - "US": US market
-            - "SH": Shanghai market
-            - "SZ": Shenzhen market
+            {MARKETS}
         code: Stock code without market prefix, e.g. "00700" for "HK.00700"
     
     Returns:
-        Dict containing security information including:
-        - stock_code: Stock code
-        - stock_name: Stock name
-        - market: Market code
-        - stock_type: Stock type (e.g., "STOCK", "ETF", "WARRANT")
-        - stock_child_type: Stock subtype (e.g., "MAIN_BOARD", "GEM")
-        - list_time: Listing date
-        - delist_time: Delisting date (if applicable)
+        Dict containing the security's basic information including:
+        - code: Stock code
+        - name: Stock name
         - lot_size: Lot size
-        - stock_owner: Company name
-        - issue_price: IPO price
-        - issue_size: IPO size
-        - net_profit: Net profit
-        - net_profit_growth: Net profit growth rate
-        - revenue: Revenue
-        - revenue_growth: Revenue growth rate
-        - eps: Earnings per share
-        - pe_ratio: Price-to-earnings ratio
-        - pb_ratio: Price-to-book ratio
-        - dividend_ratio: Dividend ratio
-        - stock_derivatives: List of related derivatives
+        - stock_type: Security type (e.g., "STOCK", "ETF", "WARRANT")
+        - stock_child_type: Warrant subtype
+        - stock_owner: Underlying stock code (warrants/options)
+        - listing_date: Listing date
+        - suspension: Whether trading is suspended
+        - delisting: Whether delisted
+        - stock_id: Security ID
+        - exchange_type: Exchange
         
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1553,36 +2055,36 @@ async def get_security_info(market: str, code: str) -> Dict[str, Any]:
         
     Note:
         - Contains static information about the security
-        - Financial data may be delayed
         - Some fields may be empty for certain security types
-        - Important for fundamental analysis
+        - Results are cached in-process for 5 minutes
     """
-    ret, data = quote_ctx.get_security_info(market, code)
-    return data.to_dict() if ret == RET_OK else {'error': data}
+    if market not in MARKETS:
+        return {'error': f"Invalid market: {market}"}
+    # With code_list set, get_stock_basicinfo ignores market and stock_type
+    ret, data = await futu_call(
+        quote_ctx.get_stock_basicinfo, market, code_list=[f"{market}.{code}"]
+    )
+    return df_to_payload(data) if ret == futu.RET_OK else error_response(data)
 
 @mcp.tool()
+@ttl_cache(ttl=300)
+@doc_tables
 async def get_security_list(market: str) -> Dict[str, Any]:
     """Get security list
     
     Args:
         market: Market code, options:
-            - "HK": Hong Kong market
-            - "US": US market
-            - "SH": Shanghai market
-            - "SZ": Shenzhen market
+            {MARKETS}
             
     Returns:
-        Dict containing list of securities:
-        - security_list: List of securities, each containing:
-            - code: Security code
-            - name: Security name
-            - lot_size: Lot size
-            - stock_type: Security type
-            - list_time: Listing date
-            - stock_id: Security ID
-            - delisting: Whether delisted
-            - main_contract: Whether it's the main contract (futures)
-            - last_trade_time: Last trade time (futures/options)
+        Dict containing the market's stocks, one row per security:
+        - code: Security code
+        - name: Security name
+        - lot_size: Lot size
+        - stock_type: Security type
+        - listing_date: Listing date
+        - stock_id: Security ID
+        - delisting: Whether delisted
             
     Raises:
         - INVALID_PARAM: Invalid parameter
@@ -1590,14 +2092,15 @@ async def get_security_list(market: str) -> Dict[str, Any]:
         - GET_SECURITY_LIST_FAILED: Failed to get security list
         
     Note:
-        - Returns all securities in the specified market
-        - Includes stocks, ETFs, warrants, etc.
+        - Returns all stocks (SecurityType STOCK) in the specified market
         - Updated daily
         - Useful for market analysis and monitoring
-        - Consider caching results for better performance
+        - Results are cached in-process for 5 minutes
     """
-    ret, data = quote_ctx.get_security_list(market)
-    return data.to_dict() if ret == RET_OK else {'error': data}
+    if market not in MARKETS:
+        return {'error': f"Invalid market: {market}"}
+    ret, data = await futu_call(quote_ctx.get_stock_basicinfo, market, 'STOCK')
+    return df_to_payload(data) if ret == futu.RET_OK else error_response(data)
 
 # Prompts
 @mcp.prompt()
@@ -1610,43 +2113,98 @@ async def option_strategy(symbol: str, expiry: str) -> str:
     """Create an option strategy analysis prompt"""
     return f"Please analyze option strategies for {symbol} expiring on {expiry}"
 
+# Optional filter fields shared by all filter kinds: (tool argument key, filter attribute)
+_FILTER_FIELD_MAP = (
+    ("filter_min", "filter_min"),
+    ("filter_max", "filter_max"),
+    ("is_no_filter", "is_no_filter"),
+    ("sort_dir", "sort"),
+)
+# Distinguishes an absent key from an explicit None in a single dict lookup
+_MISSING = object()
+# futu filter class name and kind-specific required field, in the order of
+# get_stock_filter's base/accumulate/financial arguments. Names rather than
+# classes so futu is not loaded at import time.
+_FILTER_LISTS = (
+    ("SimpleFilter", None),
+    ("AccumulateFilter", "days"),
+    ("FinancialFilter", "quarter"),
+)
+
+def build_filter_item(f: Dict[str, Any], kind: str, required: Optional[str]):
+    """Translate one tool-level filter dict into a futu stock filter object
+
+    Args:
+        f: Filter as passed to get_stock_filter
+        kind: futu filter class name, e.g. "AccumulateFilter"
+        required: Kind-specific required field copied as-is, e.g. "days"
+    """
+    item = getattr(futu, kind)()
+    item.stock_field = f["field_name"]
+    if required is not None:
+        setattr(item, required, f[required])
+    for src, dst in _FILTER_FIELD_MAP:
+        value = f.get(src, _MISSING)
+        if value is not _MISSING:
+            setattr(item, dst, value)
+    # The SDK only sends filter_min/filter_max when is_no_filter is False
+    if item.is_no_filter is None and (item.filter_min is not None or item.filter_max is not None):
+        item.is_no_filter = False
+    return item
+
+def filter_stock_to_dict(stock) -> Dict[str, Any]:
+    """Flatten a futu FilterStockData into a dict
+
+    Accumulate/financial values are keyed by tuples such as
+    ('change_rate', 5); those become 'change_rate_5'.
+    """
+    return {
+        key if isinstance(key, str) else '_'.join(map(str, key)): value
+        for key, value in vars(stock).items()
+    }
+
 @mcp.tool()
-async def get_stock_filter(base_filters: List[Dict[str, Any]] = None, 
+@doc_tables
+async def get_stock_filter(market: str,
+                         base_filters: List[Dict[str, Any]] = None,
                          accumulate_filters: List[Dict[str, Any]] = None,
                          financial_filters: List[Dict[str, Any]] = None,
-                         market: str = None,
+                         plate_code: str = None,
                          page: int = 1,
                          page_size: int = 200) -> Dict[str, Any]:
     """Get filtered stock list based on conditions
     
     Args:
+        market: Market to filter, options:
+            {MARKETS}
         base_filters: List of base filters with structure:
             {
-                "field_name": int,  # StockField enum value
+                "field_name": str,  # StockField name, e.g. "CUR_PRICE", "MARKET_VAL"
                 "filter_min": float,  # Optional minimum value
                 "filter_max": float,  # Optional maximum value
                 "is_no_filter": bool,  # Optional, whether to skip filtering
-                "sort_dir": int  # Optional, sort direction (0: No sort, 1: Ascending, 2: Descending)
+                "sort_dir": str  # Optional, "ASCEND" or "DESCEND"
             }
         accumulate_filters: List of accumulate filters with structure:
             {
-                "field_name": int,  # AccumulateField enum value
+                "field_name": str,  # StockField name, e.g. "CHANGE_RATE", "TURNOVER"
                 "filter_min": float,
                 "filter_max": float,
                 "is_no_filter": bool,
-                "sort_dir": int,  # 0: No sort, 1: Ascending, 2: Descending
+                "sort_dir": str,  # "ASCEND" or "DESCEND"
                 "days": int  # Required, number of days to accumulate
             }
         financial_filters: List of financial filters with structure:
             {
-                "field_name": int,  # FinancialField enum value
+                "field_name": str,  # StockField name, e.g. "NET_PROFIT", "PE_TTM"
                 "filter_min": float,
                 "filter_max": float,
                 "is_no_filter": bool,
-                "sort_dir": int,  # 0: No sort, 1: Ascending, 2: Descending
-                "quarter": int  # Required, financial quarter
+                "sort_dir": str,  # "ASCEND" or "DESCEND"
+                "quarter": str  # Required, "ANNUAL", "FIRST_QUARTER", "INTERIM",
+                                # "THIRD_QUARTER" or "MOST_RECENT_QUARTER"
             }
-        market: Market code, options:
+        plate_code: Optional plate to restrict the filter to, e.g.:
             - "HK.Motherboard": Hong Kong Main Board
             - "HK.GEM": Hong Kong GEM
             - "HK.BK1911": H-Share Main Board
@@ -1659,70 +2217,42 @@ async def get_stock_filter(base_filters: List[Dict[str, Any]] = None,
             - "SZ.3000004": Shenzhen ChiNext
         page: Page number, starting from 1 (default: 1)
         page_size: Number of results per page, max 200 (default: 200)
+
+    Returns:
+        Dict containing:
+        - last_page: Whether this is the last page
+        - all_count: Total number of matching stocks
+        - stock_list: Matching stocks for the requested page, each with
+          stock_code, stock_name and the filtered field values; accumulate
+          and financial values are keyed like "change_rate_5" or
+          "net_profit_annual"
     """
-    # Create filter request
-    req = {
-        "begin": (page - 1) * page_size,
-        "num": page_size
+    if market not in MARKETS:
+        return {'error': f"Invalid market: {market}"}
+
+    # Build base, accumulate and financial filters
+    filter_list = []
+    filter_args = (base_filters, accumulate_filters, financial_filters)
+    for (kind, required), filters in zip(_FILTER_LISTS, filter_args):
+        if filters:
+            filter_list.extend(build_filter_item(f, kind, required) for f in filters)
+
+    ret, data = await futu_call(
+        quote_ctx.get_stock_filter,
+        market=market,
+        filter_list=filter_list,
+        plate_code=plate_code,
+        begin=(page - 1) * page_size,
+        num=page_size
+    )
+    if ret != futu.RET_OK:
+        return error_response(data)
+    last_page, all_count, stocks = data
+    return {
+        'last_page': last_page,
+        'all_count': all_count,
+        'stock_list': [filter_stock_to_dict(stock) for stock in stocks]
     }
-    
-    # Add market filter if specified
-    if market:
-        req["plate"] = {"plate_code": market}
-    
-    # Add base filters
-    if base_filters:
-        req["baseFilterList"] = []
-        for f in base_filters:
-            filter_item = {"fieldName": f["field_name"]}
-            if "filter_min" in f:
-                filter_item["filterMin"] = f["filter_min"]
-            if "filter_max" in f:
-                filter_item["filterMax"] = f["filter_max"]
-            if "is_no_filter" in f:
-                filter_item["isNoFilter"] = f["is_no_filter"]
-            if "sort_dir" in f:
-                filter_item["sortDir"] = f["sort_dir"]
-            req["baseFilterList"].append(filter_item)
-    
-    # Add accumulate filters
-    if accumulate_filters:
-        req["accumulateFilterList"] = []
-        for f in accumulate_filters:
-            filter_item = {
-                "fieldName": f["field_name"],
-                "days": f["days"]
-            }
-            if "filter_min" in f:
-                filter_item["filterMin"] = f["filter_min"]
-            if "filter_max" in f:
-                filter_item["filterMax"] = f["filter_max"]
-            if "is_no_filter" in f:
-                filter_item["isNoFilter"] = f["is_no_filter"]
-            if "sort_dir" in f:
-                filter_item["sortDir"] = f["sort_dir"]
-            req["accumulateFilterList"].append(filter_item)
-    
-    # Add financial filters
-    if financial_filters:
-        req["financialFilterList"] = []
-        for f in financial_filters:
-            filter_item = {
-                "fieldName": f["field_name"],
-                "quarter": f["quarter"]
-            }
-            if "filter_min" in f:
-                filter_item["filterMin"] = f["filter_min"]
-            if "filter_max" in f:
-                filter_item["filterMax"] = f["filter_max"]
-            if "is_no_filter" in f:
-                filter_item["isNoFilter"] = f["is_no_filter"]
-            if "sort_dir" in f:
-                filter_item["sortDir"] = f["sort_dir"]
-            req["financialFilterList"].append(filter_item)
-
-    ret, data = quote_ctx.get_stock_filter(req)
-    return data.to_dict() if ret == RET_OK else {'error': data}
 
 @mcp.tool()
 async def get_current_time() -> Dict[str, Any]:
@@ -1736,17 +2266,45 @@ async def get_current_time() -> Dict[str, Any]:
         - time: Time string (HH:mm:ss)
         - timezone: Local timezone name
     """
-    now = datetime.now()
+    # One aware local time gives both the fields and the zone name; the
+    # name is not cached since it changes across DST transitions
+    now = datetime.now().astimezone()
+    formatted = now.strftime('%Y-%m-%d %H:%M:%S')
     return {
         'timestamp': int(now.timestamp()),
-        'datetime': now.strftime('%Y-%m-%d %H:%M:%S'),
-        'date': now.strftime('%Y-%m-%d'),
-        'time': now.strftime('%H:%M:%S'),
-        'timezone': datetime.now().astimezone().tzname()
+        'datetime': formatted,
+        'date': formatted[:10],
+        'time': formatted[11:],
+        'timezone': now.tzname()
     }
 
+# Environment forced for MCP mode: no color/ANSI output, unbuffered UTF-8
+MCP_ENVIRONMENT = {
+    'MCP_MODE': '1',
+    'NO_COLOR': '1',
+    'TERM': 'dumb',
+    'FORCE_COLOR': '0',
+    'COLORTERM': '',
+    'ANSI_COLORS_DISABLED': '1',
+    'PYTHONUNBUFFERED': '1',
+    'PYTHONIOENCODING': 'utf-8',
+}
+
+try:
+    __version__ = importlib.metadata.version('futu-stock-mcp-server')
+except importlib.metadata.PackageNotFoundError:
+    # Running from a source checkout that was never installed
+    __version__ = 'unknown'
+
+VERSION_STRING = f'futu-stock-mcp-server {__version__}'
+
 def main():
     """Main entry point for the futu-mcp-server command."""
+    # Answer a bare --version without building the parser and its epilog
+    if sys.argv[1:] == ['--version']:
+        print(VERSION_STRING)
+        return
+
     # Parse command line arguments first
     parser = argparse.ArgumentParser(
         description="Futu Stock MCP Server - A Model Context Protocol server for accessing Futu OpenAPI functionality",
@@ -1767,6 +2325,8 @@ Environment Variables:
   FUTU_SECURITY_FIRM                # Security firm: FUTUSECURITIES or FUTUINC (default: FUTUSECURITIES)
   FUTU_TRD_MARKET                   # Trading market: HK or US (default: HK)
   FUTU_DEBUG_MODE                   # Enable debug logging (default: 0)
+  FUTU_LOG_LEVEL                    # Minimum file log level (default: DEBUG)
+  FUTU_LOG_JSON                     # Write the log file as JSON lines (default: 0)
         """
     )
     
@@ -1786,25 +2346,20 @@ Environment Variables:
     parser.add_argument(
         '--version', 
         action='version', 
-        version='futu-stock-mcp-server 0.1.3'
+        version=VERSION_STRING
     )
     
     args = parser.parse_args()
     
+    global _mcp_mode
     try:
         # CRITICAL: Set MCP mode BEFORE any logging to ensure clean stdout
-        os.environ['MCP_MODE'] = '1'
-
-        # Ensure no color output or ANSI escape sequences in MCP mode
-        os.environ['NO_COLOR'] = '1'
-        os.environ['TERM'] = 'dumb'
-        os.environ['FORCE_COLOR'] = '0'
-        os.environ['COLORTERM'] = ''
-        os.environ['ANSI_COLORS_DISABLED'] = '1'
-        os.environ['PYTHONUNBUFFERED'] = '1'
-        os.environ['PYTHONIOENCODING'] = 'utf-8'
+        # and ensure no color output or ANSI escape sequences in MCP mode
+        os.environ.update(MCP_ENVIRONMENT)
+        _mcp_mode = True
 
-        # Disable Python buffering to ensure clean MCP JSON communication
+        # Only the MCP transport may write to the real stdout from here on
+        mcp_out_fd = protect_stdout()
 
         # Clean up stale processes and acquire lock
         cleanup_stale_processes()
@@ -1814,11 +2369,7 @@ Environment Variables:
             # Use file logging only - no stderr output in MCP mode
             logger.error("Failed to acquire lock. Another instance may be running.")
             sys.exit(1)
-            
-        # Set up signal handlers
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
-            
+
         # Initialize Futu connection with file logging only
         logger.info("Initializing Futu connection for MCP server...")
         if init_futu_connection(args.host, args.port):
@@ -1827,20 +2378,20 @@ Environment Variables:
 
             try:
                 # Run MCP server - stdout will be used for JSON communication only
-                logger.info("About to call mcp.run() without transport parameter")
-                mcp.run()
-                logger.info("mcp.run() completed successfully")
-            except KeyboardInterrupt:
-                logger.info("Received keyboard interrupt, shutting down gracefully...")
+                logger.info("Starting stdio transport on reserved stdout fd")
+                anyio.run(run_stdio_server, mcp_out_fd)
+                logger.info("MCP server stopped")
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                logger.info("Received shutdown request, shutting down gracefully...")
                 cleanup_all()
-                os._exit(0)
+                hard_exit(0)
             except Exception as e:
                 logger.error(f"Error running MCP server: {str(e)}")
                 cleanup_all()
-                os._exit(1)
+                hard_exit(1)
         else:
             logger.error("Failed to initialize Futu connection. MCP server will not start.")
-            os._exit(1)
+            hard_exit(1)
 
     except Exception as e:
         # In MCP mode, we should avoid printing to stdout